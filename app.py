@@ -1,11 +1,16 @@
 # Audio Fingerprinting Backend
 # Requirements: pip install fastapi uvicorn python-multipart librosa numpy scipy
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+# librosa and scipy.ndimage are imported where used: they pull in numba, scipy and
+# soundfile, which would otherwise dominate worker boot, test collection and CLI startup.
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
-import librosa
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
 import numpy as np
-from scipy import signal
+import asyncio
 import sqlite3
 import hashlib
 import json
@@ -15,6 +20,15 @@ import logging
 from typing import Optional, List, Dict, Any
 from pydantic import BaseModel
 import tempfile
+from collections import deque
+import threading
+import wave
+from contextlib import asynccontextmanager, contextmanager
+
+try:
+    import fcntl  # POSIX only; used to serialise writers across worker processes
+except ImportError:
+    fcntl = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -30,29 +44,41 @@ class APIInfo(BaseModel):
 class HealthResponse(BaseModel):
     status: str
     timestamp: str
+    ready: bool = True
+    startup_seconds: Optional[float] = None
+    warmup_seconds: Optional[float] = None
 
 class SongInfo(BaseModel):
     id: int
     filename: str
-    title: Optional[str]
-    artist: Optional[str]
-    duration: Optional[float]
-    created_at: Optional[str]
+    title: Optional[str] = None
+    artist: Optional[str] = None
+    duration: Optional[float] = None
+    created_at: Optional[str] = None
 
 class SongsResponse(BaseModel):
     songs: List[SongInfo]
     count: int
+    next_after_id: Optional[int] = None
 
 class FingerprintStats(BaseModel):
     duration: float
     peaks_found: int
     hashes_generated: int
 
+class DuplicateInfo(BaseModel):
+    song_id: int
+    confidence: float
+    coherent_matches: int
+    match_ratio: float
+
 class FingerprintResponse(BaseModel):
     success: bool
     song_id: int
     message: str
     stats: FingerprintStats
+    action: str = "stored"
+    duplicate: Optional[DuplicateInfo] = None
 
 class MatchDetails(BaseModel):
     coherent_matches: int
@@ -80,6 +106,22 @@ class IdentifyResponse(BaseModel):
     all_matches: List[MatchInfo] = []
     message: Optional[str] = None
 
+class ScanSegment(BaseModel):
+    song_info: SongInfo
+    start: float
+    end: float
+    confidence: float
+    coherent_matches: int
+    song_offset: float
+
+class ScanResponse(BaseModel):
+    success: bool
+    duration: float
+    windows_scanned: int
+    hashes_generated: int
+    unique_hashes: int
+    segments: List[ScanSegment]
+
 class DatabaseStats(BaseModel):
     total_songs: int
     total_fingerprints: int
@@ -92,11 +134,26 @@ class ResetResponse(BaseModel):
     success: bool
     message: str
 
+class DeleteResponse(BaseModel):
+    success: bool
+    song_id: int
+    fingerprints_removed: int
+    message: str
+
+class CompactResponse(BaseModel):
+    success: bool
+    started: bool
+    message: str
+
 # Audio Fingerprinting logic
 class AudioFingerprinter:
-    def __init__(self, db_path='fingerprints.db'):
+    PEAK_MODES = ('bands', 'constellation')
+    AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac')
+    
+    def __init__(self, db_path='fingerprints.db', peak_mode='constellation'):
+        if peak_mode not in self.PEAK_MODES:
+            raise ValueError(f"Unknown peak mode: {peak_mode}")
         self.db_path = db_path
-        self.init_database()
         
         # Fingerprinting parameters
         self.sample_rate = 22050
@@ -105,16 +162,84 @@ class AudioFingerprinter:
         self.n_mels = 128
         
         # Peak detection parameters
-        self.peak_threshold = 0.1
+        # 'bands': one argmax per fixed band per frame
+        # 'constellation': 2-D neighbourhood maxima thinned to a target density
+        # Hashes from different modes never match; the mode is recorded in the database
+        # and a fingerprinter with a different mode refuses to open it.
+        self.peak_mode = peak_mode
+        self.peak_threshold = -30.0  # dB relative to the loudest bin (spectrogram values are <= 0)
+        self.peak_neighborhood = (9, 21)  # (mel bins, frames ~0.5s) a constellation peak must dominate
+        self.peak_floor_db = -60.0  # ignore bins this far below the loudest bin
+        self.peak_prominence_db = 3.0  # dB above the surrounding mean (adaptive threshold)
+        self.peak_density = 8  # max constellation peaks kept per second
         self.min_time_delta = 0.1  # seconds
         self.max_time_delta = 2.0  # seconds
         self.fanout = 5  # number of target peaks per anchor
         
+        # Duplicate detection parameters (applied at ingest when requested)
+        self.duplicate_min_coherent = 20  # coherent matches needed to call a duplicate
+        self.duplicate_min_ratio = 0.15  # coherent matches / new track hashes
+        
+        # Scan (long recording) parameters
+        self.scan_chunk_seconds = 60.0  # audio fingerprinted per spectrogram pass
+        self.scan_min_coherent = 10  # coherent matches per window to report a song
+        self.scan_offset_tolerance = 0.2  # seconds of offset drift allowed when merging windows
+        self.lookup_batch_size = 500  # hashes per IN (...) lookup
+        
+        # Maintenance parameters
+        self.compact_batch_size = 10000  # orphaned rows deleted per transaction
+        self._compact_lock = threading.Lock()
+        
+        # Multi-worker parameters: every worker process shares the same database file
+        self.busy_timeout = 30.0  # seconds a connection waits for a lock
+        self.mmap_size = 1 << 30  # bytes of the index read through a shared mmap
+        self._write_lock = threading.Lock()
+        
+        # Per-process song metadata cache, invalidated when catalog_version changes
+        self._song_cache = {}
+        self._song_cache_version = None
+        self._cache_lock = threading.Lock()
+        
+        self.init_database()
+    
+    def _connect(self, readonly=False, **kwargs):
+        """Open a connection; reads go through mmap so workers share index pages in the OS page cache"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, **kwargs)
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        return conn
+    
+    @contextmanager
+    def _writing(self):
+        """Serialise writes across threads and worker processes (single writer at a time).
+        
+        Uses an flock on a sidecar lock file where available; elsewhere SQLite's own
+        busy timeout is relied on.
+        """
+        with self._write_lock:
+            if fcntl is None:
+                yield
+                return
+            
+            with open(self.db_path + '.lock', 'a') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        
     def init_database(self):
         """Initialize SQLite database for storing fingerprints"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._writing(), self._connect() as conn:
             cursor = conn.cursor()
             
+            # Incremental vacuum lets compaction reclaim pages without a full VACUUM
+            # (only takes effect on a fresh database file)
+            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            # WAL mode so readers are not blocked by ingest, deletes or compaction
+            cursor.execute('PRAGMA journal_mode = WAL')
+            
             # Songs table
             cursor.execute('''
                 CREATE TABLE IF NOT EXISTS songs (
@@ -143,16 +268,76 @@ class AudioFingerprinter:
                 CREATE INDEX IF NOT EXISTS idx_hash ON fingerprints (hash_value)
             ''')
             
+            # Index on song_id so deleting/replacing a song touches only its own postings
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_song_id ON fingerprints (song_id)
+            ''')
+            
+            # Aliases: filenames linked to an existing song instead of storing duplicate postings
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS song_aliases (
+                    filename TEXT PRIMARY KEY,
+                    song_id INTEGER NOT NULL,
+                    title TEXT,
+                    artist TEXT,
+                    duration REAL,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (song_id) REFERENCES songs (id)
+                )
+            ''')
+            cursor.execute('''
+                CREATE INDEX IF NOT EXISTS idx_alias_song_id ON song_aliases (song_id)
+            ''')
+            
+            # Catalog counters, maintained on ingest/delete so /stats never scans fingerprints.
+            # catalog_version is bumped on every catalog write; workers poll it to drop caches.
+            cursor.execute('''
+                CREATE TABLE IF NOT EXISTS catalog_stats (
+                    id INTEGER PRIMARY KEY CHECK (id = 1),
+                    total_songs INTEGER NOT NULL,
+                    total_fingerprints INTEGER NOT NULL,
+                    catalog_version INTEGER NOT NULL DEFAULT 0
+                )
+            ''')
+            cursor.execute('PRAGMA table_info(catalog_stats)')
+            columns = [row[1] for row in cursor.fetchall()]
+            if 'catalog_version' not in columns:
+                cursor.execute('ALTER TABLE catalog_stats ADD COLUMN catalog_version INTEGER NOT NULL DEFAULT 0')
+            if 'peak_mode' not in columns:
+                cursor.execute('ALTER TABLE catalog_stats ADD COLUMN peak_mode TEXT')
+            
+            # Seed counters once for databases created before the table existed
+            cursor.execute('''
+                INSERT OR IGNORE INTO catalog_stats (id, total_songs, total_fingerprints)
+                VALUES (1, (SELECT COUNT(*) FROM songs), (SELECT COUNT(*) FROM fingerprints))
+            ''')
+            
+            # Record the peak mode the catalog is fingerprinted with. Catalogs that already
+            # hold postings but no mode predate constellation peaks, so they are 'bands'.
+            cursor.execute('SELECT peak_mode, total_fingerprints FROM catalog_stats WHERE id = 1')
+            stored_mode, total_fingerprints = cursor.fetchone()
+            if stored_mode is None:
+                stored_mode = 'bands' if total_fingerprints else self.peak_mode
+                cursor.execute('UPDATE catalog_stats SET peak_mode = ? WHERE id = 1', (stored_mode,))
+            
             conn.commit()
+            
+            if stored_mode != self.peak_mode:
+                message = (f"Database {self.db_path} was fingerprinted with peak mode '{stored_mode}' but this "
+                           f"fingerprinter uses '{self.peak_mode}'; nothing would match. Set "
+                           f"AUDIOFIND_PEAK_MODE={stored_mode}, or move the database aside to switch modes")
+                logger.error(message)
+                raise RuntimeError(message)
+
             logger.info("Database initialized successfully")
     
     def load_audio(self, file_path):
         """Load audio file and return audio data and sample rate"""
         try:
             # Validate file extension
-            valid_extensions = ['.wav', '.mp3', '.m4a', '.flac']
-            if not any(file_path.lower().endswith(ext) for ext in valid_extensions):
+            if not file_path.lower().endswith(self.AUDIO_EXTENSIONS):
                 raise ValueError("Unsupported audio format")
+            import librosa
             audio, sr = librosa.load(file_path, sr=self.sample_rate)
             return audio, sr
         except Exception as e:
@@ -161,6 +346,8 @@ class AudioFingerprinter:
     
     def compute_spectrogram(self, audio):
         """Compute mel-scaled spectrogram"""
+        import librosa
+        
         stft = librosa.stft(audio, n_fft=self.n_fft, hop_length=self.hop_length)
         magnitude = np.abs(stft)
         
@@ -176,6 +363,9 @@ class AudioFingerprinter:
     
     def find_peaks(self, spectrogram):
         """Find peaks in the spectrogram using local maxima detection"""
+        if self.peak_mode == 'constellation':
+            return self.find_constellation_peaks(spectrogram)
+        
         peaks = []
         freq_bands = [(0, 10), (10, 20), (20, 40), (40, 80), (80, 128)]
         
@@ -210,6 +400,46 @@ class AudioFingerprinter:
         logger.info(f"Found {len(peaks)} peaks")
         return peaks
     
+    def find_constellation_peaks(self, spectrogram):
+        """Find 2-D time-frequency neighbourhood maxima with density control.
+        
+        A bin is a candidate when it is the maximum of its `peak_neighborhood` window,
+        lies above `peak_floor_db`, and exceeds the mean of a wider surrounding region
+        by `peak_prominence_db`, so the threshold follows local loudness. Only the
+        `peak_density` most prominent candidates in each second are kept.
+        """
+        from scipy import ndimage
+        
+        local_max = ndimage.maximum_filter(
+            spectrogram, size=self.peak_neighborhood, mode='constant', cval=-np.inf
+        ) == spectrogram
+        background = ndimage.uniform_filter(
+            spectrogram, size=tuple(2 * n + 1 for n in self.peak_neighborhood), mode='nearest'
+        )
+        prominence = spectrogram - background
+        candidates = local_max & (spectrogram > self.peak_floor_db) & (prominence > self.peak_prominence_db)
+        
+        freq_idx, time_idx = np.nonzero(candidates)
+        second = (time_idx * self.hop_length // self.sample_rate).astype(int)
+        
+        # Rank candidates by prominence within each second and keep the top peak_density
+        order = np.lexsort((-prominence[freq_idx, time_idx], second))
+        sorted_seconds = second[order]
+        rank = np.arange(len(order)) - np.searchsorted(sorted_seconds, sorted_seconds, side='left')
+        keep = order[rank < self.peak_density]
+        keep = keep[np.argsort(time_idx[keep], kind='stable')]
+        
+        peaks = [
+            {
+                'time': time_idx[i] * self.hop_length / self.sample_rate,
+                'frequency': int(freq_idx[i]),
+                'magnitude': float(spectrogram[freq_idx[i], time_idx[i]])
+            }
+            for i in keep
+        ]
+        logger.info(f"Found {len(peaks)} peaks")
+        return peaks
+    
     def generate_hashes(self, peaks):
         """Generate fingerprint hashes from peaks"""
         hashes = []
@@ -253,61 +483,613 @@ class AudioFingerprinter:
             'spectrogram_shape': spectrogram.shape
         }
     
+    def stream_audio(self, file_path):
+        """Decode an audio file block by block, yielding mono float32 arrays at `sample_rate`.
+        
+        Blocks are `scan_chunk_seconds` long and resampled with a streaming resampler,
+        so memory stays bounded however long the file is. Formats libsndfile cannot
+        read (e.g. m4a) fall back to decoding the whole file with `load_audio`.
+        """
+        import soundfile as sf
+        import soxr
+        
+        if not file_path.lower().endswith(self.AUDIO_EXTENSIONS):
+            raise ValueError("Unsupported audio format")
+        
+        try:
+            sound_file = sf.SoundFile(file_path)
+        except Exception as e:
+            logger.info(f"Streaming decode unavailable for {file_path} ({e}), decoding whole file")
+            audio, _ = self.load_audio(file_path)
+            step = int(self.scan_chunk_seconds * self.sample_rate)
+            for start in range(0, len(audio), step):
+                yield audio[start:start + step]
+            return
+        
+        with sound_file:
+            resampler = None
+            if sound_file.samplerate != self.sample_rate:
+                resampler = soxr.ResampleStream(sound_file.samplerate, self.sample_rate, 1, dtype='float32')
+            frames = int(self.scan_chunk_seconds * sound_file.samplerate)
+            
+            while True:
+                block = sound_file.read(frames, dtype='float32', always_2d=True).mean(axis=1)
+                last = len(block) < frames
+                if resampler is not None:
+                    block = resampler.resample_chunk(block, last=last)
+                if len(block):
+                    yield block
+                if last:
+                    break
+    
+    def _fingerprint_chunks(self, blocks):
+        """Fingerprint a stream of audio blocks in fixed-size chunks.
+        
+        Yields (complete_until, hashes) per chunk, where hashes carry absolute time
+        offsets and every hash before `complete_until` seconds has been emitted. Each
+        chunk is extended by `max_time_delta` of lookahead so anchors near the chunk
+        boundary still get their targets; only anchors inside the chunk are kept.
+        """
+        chunk = int(self.scan_chunk_seconds * self.sample_rate) // self.hop_length * self.hop_length
+        lookahead = int((self.max_time_delta + 1.0) * self.sample_rate)
+        core_seconds = chunk / self.sample_rate
+        
+        def chunk_hashes(segment, offset_samples):
+            offset = offset_samples / self.sample_rate
+            spectrogram = self.compute_spectrogram(segment)
+            hashes = [
+                {'hash': h['hash'], 'time_offset': h['time_offset'] + offset}
+                for h in self.generate_hashes(self.find_peaks(spectrogram))
+                if h['time_offset'] < core_seconds
+            ]
+            return offset + min(core_seconds, len(segment) / self.sample_rate), hashes
+        
+        buffer = np.zeros(0, dtype=np.float32)
+        offset_samples = 0
+        for block in blocks:
+            buffer = np.concatenate([buffer, block])
+            while len(buffer) >= chunk + lookahead:
+                yield chunk_hashes(buffer[:chunk + lookahead], offset_samples)
+                buffer = buffer[chunk:]
+                offset_samples += chunk
+        
+        while len(buffer):
+            yield chunk_hashes(buffer[:chunk + lookahead], offset_samples)
+            buffer = buffer[chunk:]
+            offset_samples += chunk
+    
+    def fingerprint_stream(self, audio):
+        """Yield hashes of a long recording (array or iterable of blocks) with absolute time offsets"""
+        blocks = [audio] if isinstance(audio, np.ndarray) else audio
+        for _, hashes in self._fingerprint_chunks(blocks):
+            yield from hashes
+    
+    def _lookup_hashes(self, cursor, hashes):
+        """Fetch postings for many hashes with batched IN (...) queries: hash -> [(song_id, time_offset)]"""
+        postings = {hash_value: [] for hash_value in hashes}
+        hashes = list(postings)
+        
+        for i in range(0, len(hashes), self.lookup_batch_size):
+            batch = hashes[i:i + self.lookup_batch_size]
+            cursor.execute(f'''
+                SELECT hash_value, song_id, time_offset FROM fingerprints
+                WHERE hash_value IN ({','.join('?' * len(batch))})
+            ''', batch)
+            for hash_value, song_id, db_time in cursor.fetchall():
+                postings[hash_value].append((song_id, db_time))
+        
+        return postings
+    
+    def scan_recording(self, audio, window_seconds=10.0, hop_seconds=5.0):
+        """Find every catalog song played in a long recording and when.
+        
+        `audio` is a file path (decoded block by block) or an already decoded array.
+        The recording is fingerprinted chunk by chunk and each chunk's distinct hashes
+        are looked up in one batch; only hashes inside the current window are kept.
+        The window slides over the hash stream, updating per-(song, offset) vote
+        counts incrementally as hashes enter and leave, so overlapping windows share
+        all work. Consecutive window detections of the same song at a consistent
+        offset are merged into (song, start, end, confidence) segments.
+        """
+        # A hop longer than the window would leave stretches of the recording unscanned
+        if hop_seconds > window_seconds:
+            raise ValueError(f"hop_seconds ({hop_seconds}) must not exceed window_seconds ({window_seconds})")
+        
+        blocks = self.stream_audio(audio) if isinstance(audio, str) else [audio]
+        samples = 0
+        
+        def counted(blocks):
+            nonlocal samples
+            for block in blocks:
+                samples += len(block)
+                yield block
+        
+        pending = deque()  # (time, postings) fingerprinted but not yet inside a window
+        window = deque()  # (time, postings) inside the current window
+        counts = {}  # (song_id, offset) -> votes in current window
+        song_totals = {}  # song_id -> all votes in current window
+        open_segments = {}  # song_id -> segment being extended
+        segments = []
+        state = {'window_start': 0.0, 'windows': 0}
+        
+        def vote(query_time, postings, step):
+            for song_id, db_time in postings:
+                key = (song_id, round(db_time - query_time, 1))
+                counts[key] = counts.get(key, 0) + step
+                song_totals[song_id] = song_totals.get(song_id, 0) + step
+                if counts[key] == 0:
+                    del counts[key]
+                if song_totals[song_id] == 0:
+                    del song_totals[song_id]
+        
+        def evaluate_window():
+            window_start = state['window_start']
+            window_end = window_start + window_seconds
+            while pending and pending[0][0] < window_end:
+                entry = pending.popleft()
+                window.append(entry)
+                vote(*entry, 1)
+            while window and window[0][0] < window_start:
+                vote(*window.popleft(), -1)
+            state['windows'] += 1
+            
+            # Best offset per song in this window
+            best = {}
+            for (song_id, offset), count in counts.items():
+                if count >= self.scan_min_coherent and count > best.get(song_id, (None, 0))[1]:
+                    best[song_id] = (offset, count)
+            
+            for song_id, (offset, count) in best.items():
+                coherence_score = count / song_totals[song_id]
+                match_strength = count / len(window)
+                confidence = (coherence_score * 0.6 + match_strength * 0.4) * 100
+                
+                segment = open_segments.get(song_id)
+                if (segment is not None and window_start <= segment['window_end'] and
+                        abs(offset - segment['song_offset']) <= self.scan_offset_tolerance):
+                    segment['window_end'] = window_end
+                    segment['confidences'].append(confidence)
+                    segment['coherent_matches'] = max(segment['coherent_matches'], count)
+                else:
+                    if segment is not None:
+                        segments.append(segment)
+                    segment = open_segments[song_id] = {
+                        'song_id': song_id,
+                        'song_offset': offset,
+                        'window_start': window_start,
+                        'window_end': window_end,
+                        'start': window_start,
+                        'end': window_end,
+                        'confidences': [confidence],
+                        'coherent_matches': count
+                    }
+                
+                # Tighten the segment to the first/last coherent hash seen in its windows
+                matched_times = [
+                    query_time
+                    for query_time, postings in window
+                    for match_song_id, db_time in postings
+                    if match_song_id == song_id and
+                    abs(db_time - query_time - segment['song_offset']) <= self.scan_offset_tolerance
+                ]
+                if matched_times:
+                    if len(segment['confidences']) == 1:
+                        segment['start'], segment['end'] = min(matched_times), max(matched_times)
+                    else:
+                        segment['start'] = min(segment['start'], min(matched_times))
+                        segment['end'] = max(segment['end'], max(matched_times))
+            
+            # Close segments whose song was not seen since their last window ended
+            for song_id in [sid for sid, seg in open_segments.items() if seg['window_end'] < window_start + hop_seconds]:
+                if song_id not in best:
+                    segments.append(open_segments.pop(song_id))
+            
+            return window_end
+        
+        hashes_generated = 0
+        unique_hashes = 0
+        with self._connect(readonly=True) as conn:
+            cursor = conn.cursor()
+            
+            for complete_until, hashes in self._fingerprint_chunks(counted(blocks)):
+                postings = self._lookup_hashes(cursor, [h['hash'] for h in hashes])
+                hashes_generated += len(hashes)
+                unique_hashes += len(postings)
+                pending.extend((h['time_offset'], postings[h['hash']]) for h in hashes)
+                
+                # Every window that ends before this point has all of its hashes
+                while state['window_start'] + window_seconds < complete_until:
+                    evaluate_window()
+                    state['window_start'] += hop_seconds
+            
+            duration = samples / self.sample_rate
+            while evaluate_window() < duration:
+                state['window_start'] += hop_seconds
+            
+            segments.extend(open_segments.values())
+            song_infos = self._song_infos(cursor, sorted({seg['song_id'] for seg in segments}))
+        
+        for segment in segments:
+            segment['end'] = min(segment['end'], duration)
+        
+        segments.sort(key=lambda seg: seg['start'])
+        logger.info(f"Scan found {len(segments)} segments in {state['windows']} windows")
+        return {
+            'duration': duration,
+            'windows_scanned': state['windows'],
+            'hashes_generated': hashes_generated,
+            'unique_hashes': unique_hashes,
+            'segments': [
+                {
+                    'song_info': song_infos[seg['song_id']],
+                    'start': seg['start'],
+                    'end': seg['end'],
+                    'confidence': sum(seg['confidences']) / len(seg['confidences']),
+                    'coherent_matches': seg['coherent_matches'],
+                    'song_offset': seg['song_offset']
+                }
+                for seg in segments if seg['song_id'] in song_infos
+            ]
+        }
+    
     def store_fingerprint(self, filename, title, artist, fingerprint, duration):
         """Store fingerprint in database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._writing(), self._connect() as conn:
             cursor = conn.cursor()
             
-            # Insert or update song and get song_id
+            cursor.execute('SELECT 1 FROM songs WHERE filename = ?', (filename,))
+            is_new = cursor.fetchone() is None
+            
+            # A stored file is no longer an alias of another song
+            cursor.execute('DELETE FROM song_aliases WHERE filename = ?', (filename,))
+            
+            # Insert or update song, keeping the existing id on re-ingest
             cursor.execute('''
-                INSERT OR REPLACE INTO songs (filename, title, artist, duration)
+                INSERT INTO songs (filename, title, artist, duration)
                 VALUES (?, ?, ?, ?)
+                ON CONFLICT(filename) DO UPDATE SET
+                    title = excluded.title,
+                    artist = excluded.artist,
+                    duration = excluded.duration
             ''', (filename, title, artist, duration))
             
             # Fetch the song_id
             cursor.execute('SELECT id FROM songs WHERE filename = ?', (filename,))
             song_id = cursor.fetchone()[0]
             
-            # Delete existing fingerprints for this song
-            cursor.execute('DELETE FROM fingerprints WHERE song_id = ?', (song_id,))
-            
-            # Insert fingerprints
-            for hash_data in fingerprint['hashes']:
-                cursor.execute('''
-                    INSERT INTO fingerprints (song_id, hash_value, time_offset)
-                    VALUES (?, ?, ?)
-                ''', (song_id, hash_data['hash'], hash_data['time_offset']))
+            if is_new:
+                self._update_stats(cursor, songs_delta=1)
+            self._replace_fingerprints(cursor, song_id, fingerprint)
             
             conn.commit()
             logger.info(f"Stored fingerprint for song ID {song_id}")
             return song_id
     
+    def _replace_fingerprints(self, cursor, song_id, fingerprint):
+        """Replace all postings of a song (uses idx_song_id, so cost is O(song postings))"""
+        cursor.execute('DELETE FROM fingerprints WHERE song_id = ?', (song_id,))
+        removed = cursor.rowcount
+        cursor.executemany('''
+            INSERT INTO fingerprints (song_id, hash_value, time_offset)
+            VALUES (?, ?, ?)
+        ''', [(song_id, h['hash'], h['time_offset']) for h in fingerprint['hashes']])
+        self._update_stats(cursor, fingerprints_delta=len(fingerprint['hashes']) - removed)
+    
+    def _update_stats(self, cursor, songs_delta=0, fingerprints_delta=0):
+        """Apply deltas to the catalog counters and bump catalog_version within the caller's transaction"""
+        cursor.execute('''
+            UPDATE catalog_stats
+            SET total_songs = total_songs + ?,
+                total_fingerprints = total_fingerprints + ?,
+                catalog_version = catalog_version + 1
+            WHERE id = 1
+        ''', (songs_delta, fingerprints_delta))
+    
+    def _song_infos(self, cursor, song_ids):
+        """Return {song_id: song_info} from the per-process cache, refreshed when another worker changed the catalog"""
+        cursor.execute('SELECT catalog_version FROM catalog_stats WHERE id = 1')
+        row = cursor.fetchone()
+        version = row[0] if row else None
+        
+        with self._cache_lock:
+            if version != self._song_cache_version:
+                self._song_cache = {}
+                self._song_cache_version = version
+            missing = [song_id for song_id in song_ids if song_id not in self._song_cache]
+        
+        for i in range(0, len(missing), self.lookup_batch_size):
+            batch = missing[i:i + self.lookup_batch_size]
+            cursor.execute(f'''
+                SELECT id, title, artist, filename FROM songs
+                WHERE id IN ({','.join('?' * len(batch))})
+            ''', batch)
+            rows = cursor.fetchall()
+            with self._cache_lock:
+                for song_id, title, artist, filename in rows:
+                    self._song_cache[song_id] = {'id': song_id, 'title': title, 'artist': artist, 'filename': filename}
+        
+        with self._cache_lock:
+            return {song_id: self._song_cache[song_id] for song_id in song_ids if song_id in self._song_cache}
+    
+    def get_stats(self):
+        """Return catalog counters in O(1)"""
+        with self._connect(readonly=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT total_songs, total_fingerprints FROM catalog_stats WHERE id = 1')
+            row = cursor.fetchone()
+        
+        total_songs, total_fingerprints = row if row else (0, 0)
+        return {
+            'total_songs': total_songs,
+            'total_fingerprints': total_fingerprints,
+            'avg_fingerprints_per_song': total_fingerprints / total_songs if total_songs else 0.0
+        }
+    
+    def iter_songs(self, after_id=0, limit=None, artist=None, title=None, batch_size=500):
+        """Yield song rows ordered by id, starting after `after_id` (keyset pagination).
+        
+        `artist` and `title` are case-insensitive substring filters.
+        """
+        for rows in self.iter_song_batches(after_id, limit, artist, title, batch_size):
+            yield from rows
+    
+    def iter_song_batches(self, after_id=0, limit=None, artist=None, title=None, batch_size=500):
+        """Like `iter_songs`, but yield lists of up to `batch_size` rows (one fetchmany each)"""
+        query = 'SELECT id, filename, title, artist, duration, created_at FROM songs WHERE id > ?'
+        params = [after_id]
+        for column, value in (('artist', artist), ('title', title)):
+            if value:
+                escaped = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                query += f" AND {column} LIKE ? ESCAPE '\\'"
+                params.append(f'%{escaped}%')
+        query += ' ORDER BY id'
+        if limit is not None:
+            query += ' LIMIT ?'
+            params.append(limit)
+        
+        # Streaming responses may resume this generator on a different threadpool thread
+        conn = self._connect(readonly=True, check_same_thread=False)
+        try:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [
+                    {
+                        'id': row[0], 'filename': row[1], 'title': row[2],
+                        'artist': row[3], 'duration': row[4], 'created_at': row[5]
+                    }
+                    for row in rows
+                ]
+        finally:
+            conn.close()
+    
+    def find_duplicate(self, fingerprint, filename=None):
+        """Return the best existing song the fingerprint coherently matches, or None.
+        
+        A song counts as a duplicate when its coherent (same-offset) matches reach both
+        `duplicate_min_coherent` and `duplicate_min_ratio` of the new track's hashes.
+        Matches against `filename` itself are ignored so re-ingest is not flagged.
+        """
+        if not fingerprint['hashes']:
+            return None
+        
+        for match in self.match_fingerprint(fingerprint):
+            if filename is not None and match['song_info']['filename'] == filename:
+                continue
+            
+            match_ratio = match['coherent_matches'] / len(fingerprint['hashes'])
+            if (match['coherent_matches'] >= self.duplicate_min_coherent and
+                    match_ratio >= self.duplicate_min_ratio):
+                return {**match, 'match_ratio': match_ratio}
+        
+        return None
+    
+    def link_song(self, filename, title, artist, duration, song_id):
+        """Record `filename` as an alias of an existing song without storing postings.
+        
+        Returns False (and links nothing) if `filename` is already stored as a song.
+        """
+        with self._writing(), self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT 1 FROM songs WHERE filename = ?', (filename,))
+            if cursor.fetchone() is not None:
+                return False
+            
+            cursor.execute('''
+                INSERT OR REPLACE INTO song_aliases (filename, song_id, title, artist, duration)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (filename, song_id, title, artist, duration))
+            conn.commit()
+            logger.info(f"Linked {filename} to song ID {song_id}")
+            return True
+    
+    def refingerprint_song(self, song_id, fingerprint, duration):
+        """Replace the fingerprints of an existing song. Returns False if the song does not exist"""
+        with self._writing(), self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('UPDATE songs SET duration = ? WHERE id = ?', (duration, song_id))
+            if cursor.rowcount == 0:
+                return False
+            
+            self._replace_fingerprints(cursor, song_id, fingerprint)
+            
+            conn.commit()
+            logger.info(f"Re-fingerprinted song ID {song_id}")
+            return True
+    
+    def delete_song(self, song_id):
+        """Delete a song and its fingerprints. Returns the number of postings removed, or None if not found"""
+        with self._writing(), self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM songs WHERE id = ?', (song_id,))
+            if cursor.rowcount == 0:
+                return None
+            
+            cursor.execute('DELETE FROM fingerprints WHERE song_id = ?', (song_id,))
+            removed = cursor.rowcount
+            cursor.execute('DELETE FROM song_aliases WHERE song_id = ?', (song_id,))
+            self._update_stats(cursor, songs_delta=-1, fingerprints_delta=-removed)
+            
+            conn.commit()
+            logger.info(f"Deleted song ID {song_id} ({removed} fingerprints)")
+            return removed
+    
+    def incremental_vacuum_enabled(self):
+        """Whether the database file can give freed pages back to the OS via incremental_vacuum"""
+        with self._connect(readonly=True) as conn:
+            return conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    
+    def compact(self, convert_vacuum=False):
+        """Purge orphaned postings, rebuild the hash index and reclaim free pages.
+        
+        Runs in small write transactions; with WAL enabled, concurrent queries keep
+        reading the last committed snapshot and are not blocked.
+        
+        Databases created before incremental auto-vacuum was enabled cannot shrink:
+        freed pages stay on the freelist for reuse by later ingests. Pass
+        `convert_vacuum=True` to switch such a file to incremental mode with a full
+        VACUUM, which rewrites the whole file and blocks all writers while it runs.
+        """
+        if not self._compact_lock.acquire(blocking=False):
+            logger.info("Compaction already running, skipping")
+            return False
+        
+        try:
+            with self._connect() as conn:
+                cursor = conn.cursor()
+                
+                # Purge postings orphaned by earlier INSERT OR REPLACE re-ingests in one pass
+                # over fingerprint ids. Batches are found outside the writer lock and the lock
+                # is released between batches so ingest can interleave.
+                last_id = 0
+                while True:
+                    cursor.execute('''
+                        SELECT f.id FROM fingerprints f
+                        LEFT JOIN songs s ON f.song_id = s.id
+                        WHERE s.id IS NULL AND f.id > ?
+                        ORDER BY f.id
+                        LIMIT ?
+                    ''', (last_id, self.compact_batch_size))
+                    orphan_ids = [row[0] for row in cursor.fetchall()]
+                    if not orphan_ids:
+                        break
+                    last_id = orphan_ids[-1]
+                    
+                    with self._writing():
+                        cursor.executemany('DELETE FROM fingerprints WHERE id = ?', [(i,) for i in orphan_ids])
+                        purged = cursor.rowcount
+                        # Only bump catalog_version (and so every worker's cache) on a real change
+                        if purged > 0:
+                            self._update_stats(cursor, fingerprints_delta=-purged)
+                        conn.commit()
+                    if len(orphan_ids) < self.compact_batch_size:
+                        break
+                
+                # Each remaining step takes the writer lock on its own, so ingest can run in between
+                with self._writing():
+                    cursor.execute('REINDEX idx_hash')
+                    conn.commit()
+                
+                cursor.execute('PRAGMA auto_vacuum')
+                if cursor.fetchone()[0] == 0:
+                    if convert_vacuum:
+                        logger.info("Converting database to incremental auto-vacuum (full VACUUM, blocks writers)")
+                        with self._writing():
+                            cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                            cursor.execute('VACUUM')
+                    else:
+                        logger.warning("Database was created without incremental auto-vacuum; freed pages "
+                                       "are kept for reuse. Run compaction with convert_vacuum to shrink the file")
+                
+                with self._writing():
+                    cursor.execute('PRAGMA incremental_vacuum')
+                    cursor.fetchall()
+                    conn.commit()
+                
+                # SQLite coordinates the checkpoint with readers and writers itself
+                cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                cursor.fetchall()
+            
+            logger.info("Database compaction finished")
+            return True
+        finally:
+            self._compact_lock.release()
+    
+    def warm_up(self, preload_index=True):
+        """Exercise the decode/fingerprint pipeline once and optionally page in the hash index.
+        
+        The first librosa call imports numba/scipy/soundfile and JIT-compiles its
+        kernels; doing it here keeps that cost off the first real request.
+        Returns the time taken in seconds.
+        """
+        start = time.perf_counter()
+        
+        t = np.arange(self.sample_rate) / self.sample_rate
+        tone = (np.sin(2 * np.pi * 440 * t) * 0.5 * 32767).astype(np.int16)
+        with tempfile.NamedTemporaryFile(delete=False, suffix='.wav') as temp_file:
+            temp_path = temp_file.name
+        try:
+            with wave.open(temp_path, 'wb') as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.sample_rate)
+                wav.writeframes(tone.tobytes())
+            audio, _ = self.load_audio(temp_path)
+            self.fingerprint_audio(audio)
+        finally:
+            os.remove(temp_path)
+        
+        if preload_index:
+            # Walk idx_hash once so its pages sit in the shared page cache / mmap
+            with self._connect(readonly=True) as conn:
+                conn.execute(
+                    "SELECT COUNT(*) FROM fingerprints INDEXED BY idx_hash WHERE hash_value > ''"
+                ).fetchone()
+        
+        elapsed = time.perf_counter() - start
+        logger.info(f"Warm-up finished in {elapsed:.2f}s")
+        return elapsed
+    
+    def reset(self):
+        """Drop all songs and fingerprints (for development/testing purposes)"""
+        with self._writing(), self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DROP TABLE IF EXISTS fingerprints')
+            cursor.execute('DROP TABLE IF EXISTS songs')
+            cursor.execute('DROP TABLE IF EXISTS song_aliases')
+            # Keep catalog_version monotonic so other workers notice the reset;
+            # the empty catalog adopts this fingerprinter's peak mode
+            cursor.execute('''
+                UPDATE catalog_stats
+                SET total_songs = 0, total_fingerprints = 0, catalog_version = catalog_version + 1,
+                    peak_mode = ?
+            ''', (self.peak_mode,))
+            conn.commit()
+        
+        self.init_database()
+    
     def match_fingerprint(self, query_fingerprint):
         """Match query fingerprint against database"""
-        with sqlite3.connect(self.db_path) as conn:
+        with self._connect(readonly=True) as conn:
             cursor = conn.cursor()
-            matches = {}
+            postings = self._lookup_hashes(cursor, [h['hash'] for h in query_fingerprint['hashes']])
             
+            time_pairs = {}
             for hash_data in query_fingerprint['hashes']:
-                query_hash = hash_data['hash']
                 query_time = hash_data['time_offset']
-                
-                cursor.execute('''
-                    SELECT f.song_id, f.time_offset, s.title, s.artist, s.filename
-                    FROM fingerprints f
-                    JOIN songs s ON f.song_id = s.id
-                    WHERE f.hash_value = ?
-                ''', (query_hash,))
-                
-                results = cursor.fetchall()
-                
-                for song_id, db_time, title, artist, filename in results:
-                    if song_id not in matches:
-                        matches[song_id] = {
-                            'song_info': {'id': song_id, 'title': title, 'artist': artist, 'filename': filename},
-                            'time_pairs': []
-                        }
-                    matches[song_id]['time_pairs'].append((query_time, db_time))
+                for song_id, db_time in postings[hash_data['hash']]:
+                    time_pairs.setdefault(song_id, []).append((query_time, db_time))
+            
+            candidates = [song_id for song_id, pairs in time_pairs.items() if len(pairs) >= 3]
+            song_infos = self._song_infos(cursor, candidates)
+        
+        # Postings whose song no longer exists (e.g. orphans awaiting compaction) are ignored
+        matches = {
+            song_id: {'song_info': song_infos[song_id], 'time_pairs': time_pairs[song_id]}
+            for song_id in candidates if song_id in song_infos
+        }
         
         best_matches = []
         
@@ -343,14 +1125,55 @@ class AudioFingerprinter:
         logger.info(f"Found {len(best_matches)} potential matches")
         return best_matches
 
-# Initialize fingerprinter
-fingerprinter = AudioFingerprinter()
+# Fingerprinter is created in the lifespan handler so importing this module stays cheap
+fingerprinter: Optional[AudioFingerprinter] = None
+
+# Cold-start budget (seconds) for module import + fingerprinter/database initialisation
+STARTUP_BUDGET_SECONDS = float(os.environ.get('AUDIOFIND_STARTUP_BUDGET', '2.0'))
+
+async def _warm_up(app):
+    """Warm up in the background; /health reports ready once this completes"""
+    preload_index = os.environ.get('AUDIOFIND_PRELOAD_INDEX', '1') != '0'
+    try:
+        app.state.warmup_seconds = await run_in_threadpool(fingerprinter.warm_up, preload_index)
+    except Exception as e:
+        logger.error(f"Warm-up failed, serving without it: {e}")
+    finally:
+        app.state.ready = True
+
+@asynccontextmanager
+async def lifespan(app):
+    """Initialise the fingerprinter and database, then start the optional warm-up"""
+    global fingerprinter
+    start = time.perf_counter()
+    fingerprinter = AudioFingerprinter(peak_mode=os.environ.get('AUDIOFIND_PEAK_MODE', 'constellation'))
+    init_seconds = time.perf_counter() - start
+    
+    app.state.startup_seconds = _IMPORT_SECONDS + init_seconds
+    app.state.warmup_seconds = None
+    app.state.ready = False
+    logger.info(f"Cold start: import {_IMPORT_SECONDS:.2f}s + init {init_seconds:.2f}s "
+                f"(budget {STARTUP_BUDGET_SECONDS:.2f}s)")
+    if app.state.startup_seconds > STARTUP_BUDGET_SECONDS:
+        logger.warning(f"Cold start of {app.state.startup_seconds:.2f}s exceeds budget of {STARTUP_BUDGET_SECONDS:.2f}s")
+    
+    warm_up_task = None
+    if os.environ.get('AUDIOFIND_WARMUP', '1') != '0':
+        warm_up_task = asyncio.create_task(_warm_up(app))
+    else:
+        app.state.ready = True
+    
+    yield
+    
+    if warm_up_task is not None and not warm_up_task.done():
+        await warm_up_task
 
 # Create FastAPI app
 app = FastAPI(
     title="Audio Fingerprinting API",
     description="A Shazam-style audio recognition engine that can fingerprint and identify songs",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Add CORS middleware (restrict to specific origins in production)
@@ -371,67 +1194,213 @@ async def home():
         endpoints={
             "GET /": "API information",
             "GET /health": "Health check",
-            "GET /songs": "List all songs",
+            "GET /songs": "List songs (supports after_id/limit pagination and artist/title filters)",
+            "GET /songs/stream": "Stream songs as NDJSON",
+            "DELETE /songs/{id}": "Delete a song and its fingerprints",
+            "POST /songs/{id}/fingerprint": "Re-fingerprint an existing song (requires audio file)",
             "POST /fingerprint": "Add song to database (requires audio file)",
             "POST /identify": "Identify song from audio (requires audio file)",
+            "POST /scan": "Find all songs and their time spans in a long recording (requires audio file)",
             "GET /stats": "Database statistics",
             "POST /reset": "Reset database",
+            "POST /compact": "Purge orphaned fingerprints and rebuild the hash index in the background (?convert_vacuum=true to shrink older databases)",
             "GET /docs": "Interactive API documentation"
         },
         usage={
-            "fingerprint": "Send POST with 'audio' file + optional 'title' and 'artist' form data",
+            "fingerprint": "Send POST with 'audio' file + optional 'title', 'artist' and 'on_duplicate' (store/link/reject) form data",
             "identify": "Send POST with 'audio' file to identify"
         }
     )
 
 @app.get("/health", response_model=HealthResponse)
-async def health_check():
-    """Health check endpoint"""
+async def health_check(response: Response):
+    """Health check endpoint; returns 503 until startup and warm-up have finished"""
+    ready = getattr(app.state, 'ready', False)
+    if not ready:
+        response.status_code = 503
+    
     return HealthResponse(
-        status="healthy",
-        timestamp=datetime.now().isoformat()
+        status="healthy" if ready else "starting",
+        timestamp=datetime.now().isoformat(),
+        ready=ready,
+        startup_seconds=getattr(app.state, 'startup_seconds', None),
+        warmup_seconds=getattr(app.state, 'warmup_seconds', None)
     )
 
 @app.get("/songs", response_model=SongsResponse)
-async def get_songs():
-    """Get all songs in database"""
+async def get_songs(
+    after_id: int = Query(0, ge=0, description="Return songs with id greater than this (keyset cursor)"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Page size (all songs if omitted)"),
+    artist: Optional[str] = Query(None, description="Case-insensitive artist substring filter"),
+    title: Optional[str] = Query(None, description="Case-insensitive title substring filter")
+):
+    """Get songs in database, optionally paginated and filtered"""
     try:
-        with sqlite3.connect(fingerprinter.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT id, filename, title, artist, duration, created_at FROM songs')
-            songs = [SongInfo(id=row[0], filename=row[1], title=row[2], artist=row[3], duration=row[4], created_at=row[5]) 
-                     for row in cursor.fetchall()]
+        songs = [SongInfo(**row) for row in fingerprinter.iter_songs(after_id, limit, artist, title)]
+        next_after_id = songs[-1].id if limit is not None and len(songs) == limit else None
         
-        return SongsResponse(songs=songs, count=len(songs))
+        return SongsResponse(songs=songs, count=len(songs), next_after_id=next_after_id)
     except Exception as e:
         logger.error(f"Error getting songs: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/songs/stream")
+async def stream_songs(
+    after_id: int = Query(0, ge=0, description="Return songs with id greater than this (keyset cursor)"),
+    artist: Optional[str] = Query(None, description="Case-insensitive artist substring filter"),
+    title: Optional[str] = Query(None, description="Case-insensitive title substring filter")
+):
+    """Stream songs as newline-delimited JSON without materialising the full list"""
+    batches = fingerprinter.iter_song_batches(after_id, None, artist, title)
+    
+    async def ndjson_chunks():
+        # One threadpool hop and one chunk per fetchmany batch rather than per row
+        try:
+            while True:
+                rows = await run_in_threadpool(next, batches, None)
+                if rows is None:
+                    break
+                yield ''.join(json.dumps(row) + '\n' for row in rows)
+        finally:
+            # Runs on completion and on client disconnect; closing the generator
+            # closes its connection. If a fetch is still running in the threadpool,
+            # the generator is closed when that thread drops the last reference.
+            try:
+                batches.close()
+            except ValueError:
+                pass
+    
+    return StreamingResponse(ndjson_chunks(), media_type="application/x-ndjson")
+
 @app.post("/fingerprint", response_model=FingerprintResponse)
 async def fingerprint_song(
     audio: UploadFile = File(..., description="Audio file to fingerprint"),
     title: str = Form("Unknown", description="Song title"),
-    artist: str = Form("Unknown", description="Artist name")
+    artist: str = Form("Unknown", description="Artist name"),
+    on_duplicate: str = Form("store", description="What to do if the track duplicates an existing song: store, link or reject")
 ):
     """Fingerprint and store a song"""
     try:
         if not audio.filename:
             raise HTTPException(status_code=400, detail="No file selected")
+        if on_duplicate not in ("store", "link", "reject"):
+            raise HTTPException(status_code=400, detail="on_duplicate must be one of: store, link, reject")
         
         with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1]) as temp_file:
             temp_file.write(await audio.read())
             temp_path = temp_file.name
         
         try:
-            audio_data, sr = fingerprinter.load_audio(temp_path)
+            # Decoding, fingerprinting and waiting for the writer lock all happen in the
+            # threadpool so this worker keeps serving queries meanwhile
+            audio_data, sr = await run_in_threadpool(fingerprinter.load_audio, temp_path)
             duration = len(audio_data) / sr
-            fingerprint = fingerprinter.fingerprint_audio(audio_data)
-            song_id = fingerprinter.store_fingerprint(audio.filename, title, artist, fingerprint, duration)
+            fingerprint = await run_in_threadpool(fingerprinter.fingerprint_audio, audio_data)
+            stats = FingerprintStats(
+                duration=duration,
+                peaks_found=len(fingerprint['peaks']),
+                hashes_generated=len(fingerprint['hashes'])
+            )
+            
+            duplicate = None
+            if on_duplicate != "store":
+                duplicate = await run_in_threadpool(fingerprinter.find_duplicate, fingerprint, audio.filename)
+            
+            if duplicate:
+                existing = duplicate['song_info']
+                duplicate_info = DuplicateInfo(
+                    song_id=existing['id'],
+                    confidence=duplicate['confidence'],
+                    coherent_matches=duplicate['coherent_matches'],
+                    match_ratio=duplicate['match_ratio']
+                )
+                if on_duplicate == "reject":
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f'Duplicate of song {existing["id"]}: "{existing["title"]}" by {existing["artist"]}'
+                    )
+                
+                if not await run_in_threadpool(
+                    fingerprinter.link_song, audio.filename, title, artist, duration, existing['id']
+                ):
+                    raise HTTPException(
+                        status_code=409,
+                        detail=f'"{audio.filename}" is already stored as a song; it cannot also be linked to song {existing["id"]}'
+                    )
+                return FingerprintResponse(
+                    success=True,
+                    song_id=existing['id'],
+                    message=f'Linked "{title}" by {artist} to existing song "{existing["title"]}"',
+                    stats=stats,
+                    action="linked",
+                    duplicate=duplicate_info
+                )
+            
+            song_id = await run_in_threadpool(
+                fingerprinter.store_fingerprint, audio.filename, title, artist, fingerprint, duration
+            )
             
             return FingerprintResponse(
                 success=True,
                 song_id=song_id,
                 message=f'Successfully fingerprinted "{title}" by {artist}',
+                stats=stats
+            )
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error fingerprinting song: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/songs/{song_id}", response_model=DeleteResponse)
+async def delete_song(song_id: int):
+    """Delete a song and its fingerprints"""
+    try:
+        removed = await run_in_threadpool(fingerprinter.delete_song, song_id)
+        if removed is None:
+            raise HTTPException(status_code=404, detail="Song not found")
+        
+        return DeleteResponse(
+            success=True,
+            song_id=song_id,
+            fingerprints_removed=removed,
+            message=f"Deleted song {song_id}"
+        )
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error deleting song: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/songs/{song_id}/fingerprint", response_model=FingerprintResponse)
+async def refingerprint_song(
+    song_id: int,
+    audio: UploadFile = File(..., description="Audio file to re-fingerprint the song from")
+):
+    """Replace the fingerprints of an existing song"""
+    try:
+        if not audio.filename:
+            raise HTTPException(status_code=400, detail="No file selected")
+        
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1]) as temp_file:
+            temp_file.write(await audio.read())
+            temp_path = temp_file.name
+        
+        try:
+            audio_data, sr = await run_in_threadpool(fingerprinter.load_audio, temp_path)
+            duration = len(audio_data) / sr
+            fingerprint = await run_in_threadpool(fingerprinter.fingerprint_audio, audio_data)
+            if not await run_in_threadpool(fingerprinter.refingerprint_song, song_id, fingerprint, duration):
+                raise HTTPException(status_code=404, detail="Song not found")
+            
+            return FingerprintResponse(
+                success=True,
+                song_id=song_id,
+                message=f"Successfully re-fingerprinted song {song_id}",
                 stats=FingerprintStats(
                     duration=duration,
                     peaks_found=len(fingerprint['peaks']),
@@ -441,9 +1410,11 @@ async def fingerprint_song(
         finally:
             if os.path.exists(temp_path):
                 os.remove(temp_path)
-        
+    
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fingerprinting song: {e}")
+        logger.error(f"Error re-fingerprinting song: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/identify", response_model=IdentifyResponse)
@@ -460,9 +1431,9 @@ async def identify_song(
             temp_path = temp_file.name
         
         try:
-            audio_data, sr = fingerprinter.load_audio(temp_path)
-            query_fingerprint = fingerprinter.fingerprint_audio(audio_data)
-            matches = fingerprinter.match_fingerprint(query_fingerprint)
+            audio_data, sr = await run_in_threadpool(fingerprinter.load_audio, temp_path)
+            query_fingerprint = await run_in_threadpool(fingerprinter.fingerprint_audio, audio_data)
+            matches = await run_in_threadpool(fingerprinter.match_fingerprint, query_fingerprint)
             
             if not matches:
                 return IdentifyResponse(
@@ -509,28 +1480,55 @@ async def identify_song(
         logger.error(f"Error identifying song: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/scan", response_model=ScanResponse)
+async def scan_recording(
+    audio: UploadFile = File(..., description="Long recording to scan (e.g. a broadcast capture)"),
+    window_seconds: float = Form(10.0, gt=0, description="Length of the sliding query window"),
+    hop_seconds: float = Form(5.0, gt=0, description="Step between consecutive windows")
+):
+    """Find every catalog song in a long recording and the time span it plays"""
+    try:
+        if not audio.filename:
+            raise HTTPException(status_code=400, detail="No file selected")
+        if hop_seconds > window_seconds:
+            raise HTTPException(status_code=400, detail="hop_seconds must not exceed window_seconds")
+        
+        # Copy the upload in pieces; broadcast captures can be far larger than memory should hold
+        with tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(audio.filename)[1]) as temp_file:
+            while piece := await audio.read(1 << 20):
+                temp_file.write(piece)
+            temp_path = temp_file.name
+        
+        try:
+            # Decoding and scanning can take minutes; keep the event loop (and /health) responsive
+            result = await run_in_threadpool(fingerprinter.scan_recording, temp_path, window_seconds, hop_seconds)
+            
+            return ScanResponse(
+                success=True,
+                duration=result['duration'],
+                windows_scanned=result['windows_scanned'],
+                hashes_generated=result['hashes_generated'],
+                unique_hashes=result['unique_hashes'],
+                segments=[
+                    ScanSegment(**{**seg, 'song_info': SongInfo(**seg['song_info'])})
+                    for seg in result['segments']
+                ]
+            )
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error scanning recording: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.get("/stats", response_model=StatsResponse)
 async def get_stats():
     """Get database statistics"""
     try:
-        with sqlite3.connect(fingerprinter.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM songs')
-            total_songs = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT COUNT(*) FROM fingerprints')
-            total_fingerprints = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT AVG(fingerprint_count) FROM (SELECT COUNT(*) as fingerprint_count FROM fingerprints GROUP BY song_id)')
-            avg_fingerprints_per_song = cursor.fetchone()[0] or 0.0
-            
-        return StatsResponse(
-            database_stats=DatabaseStats(
-                total_songs=total_songs,
-                total_fingerprints=total_fingerprints,
-                avg_fingerprints_per_song=avg_fingerprints_per_song
-            )
-        )
+        return StatsResponse(database_stats=DatabaseStats(**fingerprinter.get_stats()))
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -539,18 +1537,30 @@ async def get_stats():
 async def reset_database():
     """Reset the database (for development/testing purposes)"""
     try:
-        with sqlite3.connect(fingerprinter.db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute('DROP TABLE IF EXISTS fingerprints')
-            cursor.execute('DROP TABLE IF EXISTS songs')
-            conn.commit()
-        
-        fingerprinter.init_database()
+        await run_in_threadpool(fingerprinter.reset)
         return ResetResponse(success=True, message="Database reset successfully")
     except Exception as e:
         logger.error(f"Error resetting database: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/compact", response_model=CompactResponse)
+async def compact_database(
+    background_tasks: BackgroundTasks,
+    convert_vacuum: bool = Query(False, description="Convert an older database to incremental auto-vacuum "
+                                                    "with a full VACUUM (rewrites the file, blocks writers)")
+):
+    """Purge orphaned postings, rebuild the hash index and reclaim free pages in the background"""
+    if fingerprinter._compact_lock.locked():
+        return CompactResponse(success=True, started=False, message="Compaction already running")
+    
+    background_tasks.add_task(fingerprinter.compact, convert_vacuum)
+    if convert_vacuum or await run_in_threadpool(fingerprinter.incremental_vacuum_enabled):
+        message = "Compaction started"
+    else:
+        message = ("Compaction started; this database does not use incremental auto-vacuum, so freed "
+                   "pages are kept for reuse instead of shrinking the file (pass convert_vacuum=true to convert)")
+    return CompactResponse(success=True, started=True, message=message)
+
 @app.get("/files/{filename}", response_class=FileResponse)
 async def get_file(filename: str):
     """Serve uploaded audio files"""
@@ -577,4 +1587,6 @@ async def generic_exception_handler(request, exc):
     return JSONResponse(
         status_code=500,
         content={"success": False, "detail": "Internal server error"}
-    )
\ No newline at end of file
+    )
+
+_IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
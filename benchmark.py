@@ -0,0 +1,113 @@
+# Benchmark for peak-picking modes
+# Compares accuracy against index size for each AudioFingerprinter peak mode.
+# Usage: python benchmark.py <audio_dir> [--queries 30] [--snippet-seconds 5] [--snr-db 20]
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+from app import AudioFingerprinter
+
+def add_noise(audio, snr_db, rng):
+    """Add white noise at the given signal-to-noise ratio"""
+    signal_power = np.mean(audio ** 2) or 1e-12
+    noise_power = signal_power / (10 ** (snr_db / 10))
+    return audio + rng.normal(0, np.sqrt(noise_power), len(audio))
+
+def benchmark_mode(mode, audio_files, args):
+    """Ingest every file with one peak mode, then query noisy snippets"""
+    with tempfile.TemporaryDirectory() as temp_dir:
+        fingerprinter = AudioFingerprinter(db_path=os.path.join(temp_dir, 'bench.db'), peak_mode=mode)
+        if args.bands_threshold is not None:
+            fingerprinter.peak_threshold = args.bands_threshold
+
+        # Ingest
+        songs = []
+        total_duration = 0.0
+        total_hashes = 0
+        start = time.perf_counter()
+        for audio_file in audio_files:
+            audio, sr = fingerprinter.load_audio(str(audio_file))
+            fingerprint = fingerprinter.fingerprint_audio(audio)
+            song_id = fingerprinter.store_fingerprint(audio_file.name, audio_file.stem, None, fingerprint, len(audio) / sr)
+            songs.append((song_id, audio))
+            total_duration += len(audio) / sr
+            total_hashes += len(fingerprint['hashes'])
+        ingest_time = time.perf_counter() - start
+
+        with fingerprinter._connect() as conn:
+            conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        db_size = os.path.getsize(fingerprinter.db_path)
+
+        # Query
+        rng = np.random.default_rng(args.seed)
+        picker = random.Random(args.seed)
+        snippet_len = int(args.snippet_seconds * fingerprinter.sample_rate)
+        correct = 0
+        query_hashes = 0
+        query_postings = 0
+        start = time.perf_counter()
+        for _ in range(args.queries):
+            song_id, audio = picker.choice(songs)
+            offset = picker.randint(0, max(0, len(audio) - snippet_len))
+            snippet = add_noise(audio[offset:offset + snippet_len], args.snr_db, rng)
+
+            query = fingerprinter.fingerprint_audio(snippet)
+            with fingerprinter._connect(readonly=True) as conn:
+                postings = fingerprinter._lookup_hashes(conn.cursor(), [h['hash'] for h in query['hashes']])
+            query_hashes += len(query['hashes'])
+            query_postings += sum(len(postings[h['hash']]) for h in query['hashes'])
+
+            matches = fingerprinter.match_fingerprint(query)
+            if matches and matches[0]['song_info']['id'] == song_id:
+                correct += 1
+        query_time = time.perf_counter() - start
+
+    return {
+        'mode': mode,
+        'accuracy': correct / args.queries * 100,
+        'hashes_per_second': total_hashes / total_duration if total_duration else 0.0,
+        'total_hashes': total_hashes,
+        'db_size_mb': db_size / (1024 * 1024),
+        'postings_per_query': query_postings / args.queries,
+        'hashes_per_query': query_hashes / args.queries,
+        'ingest_seconds': ingest_time,
+        'query_ms': query_time / args.queries * 1000
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare peak-picking modes on a directory of songs")
+    parser.add_argument('audio_dir', help="Directory with .wav/.mp3/.m4a/.flac files")
+    parser.add_argument('--modes', nargs='+', default=list(AudioFingerprinter.PEAK_MODES))
+    parser.add_argument('--queries', type=int, default=30)
+    parser.add_argument('--snippet-seconds', type=float, default=5.0)
+    parser.add_argument('--snr-db', type=float, default=20.0)
+    parser.add_argument('--bands-threshold', type=float, default=None,
+                        help="Override peak_threshold (only used by the 'bands' mode)")
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    audio_files = []
+    for ext in ['*.mp3', '*.wav', '*.m4a', '*.flac']:
+        audio_files.extend(Path(args.audio_dir).glob(ext))
+    audio_files.sort()
+    if not audio_files:
+        print(f"No audio files found in {args.audio_dir}")
+        return
+
+    print(f"Benchmarking {len(audio_files)} songs, {args.queries} queries of {args.snippet_seconds}s at {args.snr_db} dB SNR")
+    header = f"{'mode':<14}{'accuracy %':>11}{'hashes/s':>10}{'db MB':>8}{'hashes/q':>10}{'postings/q':>12}{'query ms':>10}"
+    print(header)
+    print("-" * len(header))
+    for mode in args.modes:
+        r = benchmark_mode(mode, audio_files, args)
+        print(f"{r['mode']:<14}{r['accuracy']:>11.1f}{r['hashes_per_second']:>10.1f}{r['db_size_mb']:>8.2f}"
+              f"{r['hashes_per_query']:>10.1f}{r['postings_per_query']:>12.1f}{r['query_ms']:>10.1f}")
+
+if __name__ == '__main__':
+    main()
@@ -18,12 +18,13 @@ class AudioFingerprintClient:
         except:
             return None
     
-    def get_songs(self):
-        """Get all songs in database"""
-        response = requests.get(f'{self.base_url}/songs')
+    def get_songs(self, after_id=0, limit=None, artist=None, title=None):
+        """Get songs in database, optionally paginated and filtered"""
+        params = {'after_id': after_id, 'limit': limit, 'artist': artist, 'title': title}
+        response = requests.get(f'{self.base_url}/songs', params={k: v for k, v in params.items() if v is not None})
         return response.json()
     
-    def fingerprint_song(self, audio_path, title=None, artist=None):
+    def fingerprint_song(self, audio_path, title=None, artist=None, on_duplicate='store'):
         """Add song to database"""
         if not os.path.exists(audio_path):
             return {'error': f'File not found: {audio_path}'}
@@ -37,7 +38,7 @@ class AudioFingerprintClient:
         
         with open(audio_path, 'rb') as audio_file:
             files = {'audio': audio_file}
-            data = {'title': title, 'artist': artist}
+            data = {'title': title, 'artist': artist, 'on_duplicate': on_duplicate}
             
             response = requests.post(f'{self.base_url}/fingerprint', files=files, data=data)
             return response.json()
@@ -52,11 +53,32 @@ class AudioFingerprintClient:
             response = requests.post(f'{self.base_url}/identify', files=files)
             return response.json()
     
+    def scan_recording(self, audio_path, window_seconds=10.0, hop_seconds=5.0):
+        """Find all songs and their time spans in a long recording"""
+        if not os.path.exists(audio_path):
+            return {'error': f'File not found: {audio_path}'}
+        
+        with open(audio_path, 'rb') as audio_file:
+            files = {'audio': audio_file}
+            data = {'window_seconds': window_seconds, 'hop_seconds': hop_seconds}
+            response = requests.post(f'{self.base_url}/scan', files=files, data=data)
+            return response.json()
+    
     def get_stats(self):
         """Get database statistics"""
         response = requests.get(f'{self.base_url}/stats')
         return response.json()
     
+    def delete_song(self, song_id):
+        """Delete a song and its fingerprints"""
+        response = requests.delete(f'{self.base_url}/songs/{song_id}')
+        return response.json()
+    
+    def compact_database(self, convert_vacuum=False):
+        """Start background database compaction"""
+        response = requests.post(f'{self.base_url}/compact', params={'convert_vacuum': convert_vacuum})
+        return response.json()
+    
     def reset_database(self):
         """Reset database"""
         response = requests.post(f'{self.base_url}/reset')